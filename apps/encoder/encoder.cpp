@@ -23,6 +23,7 @@
 // SOFTWARE.
 
 #include <chrono>
+#include <cstdlib>
 #include <fstream>
 #include <iostream>
 #include <string>
@@ -71,10 +72,16 @@ main(int argc, char** argv)
     bool        doDumpHelp         = false;
     bool        doDumpAsYaml       = false;
     bool        doDumpAsPyStruct   = true;
+    bool        doBatch            = false;
+    bool        doServer           = false;
     bool        readInputFromStdin = false;
     std::string inputFilename;
     for (int i = 1; i < argc; ++i) {
-        if (std::string(argv[i]) == "-d") {
+        if (std::string(argv[i]) == "--batch") {
+            doBatch = true;
+        } else if (std::string(argv[i]) == "--server") {
+            doServer = true;
+        } else if (std::string(argv[i]) == "-d") {
             doDumpAsYaml     = true;
             doDumpAsPyStruct = false;
         } else if (std::string(argv[i]) == "-n") {
@@ -102,15 +109,94 @@ main(int argc, char** argv)
         printf("Options:\n");
         printf(" -d    Dumps on stdout the parsed file as YAML (loop). Default is as Python structure.\n");
         printf(" -n    Dumps on stdout some performance statistics on the parsing and YAML dumping (memory and timing)\n");
+        printf(" --batch  Reads a length-prefixed stream of documents on stdin and emits a matching stream on stdout\n");
+        printf(" --server Processes length-prefixed documents on stdin one at a time, answering after each one\n");
         printf(" -h    This help\n");
         return 1;
     }
 
-    if (readInputFromStdin != inputFilename.empty()) {
+    if (!doBatch && !doServer && readInputFromStdin != inputFilename.empty()) {
         printf("Error: one and only one way to get the input text shall be provided ('-' and <filename> are exclusive)\n");
         return 1;
     }
 
+    // Server mode: process documents one at a time in one single long-lived process, answering after each one.
+    // A request is "<payload byte quantity>\n" followed by the payload bytes, an answer is
+    // "<payload byte quantity> <status>\n" followed by the payload bytes (status as in batch mode), flushed so that
+    // the driving process can block on it. The server exits on end of the input stream.
+    // =============================================================================================================
+    if (doServer) {
+        char header[64];
+        while (fgets(header, sizeof(header), stdin)) {
+            // Read the document
+            size_t      docSize = (size_t)strtoull(header, nullptr, 10);
+            std::string docText(docSize, '\0');
+            if (docSize > 0 && fread(&docText[0], 1, docSize, stdin) != docSize) { break; }
+            if (docText.empty() || docText.back() != '\n') { docText.push_back('\n'); }
+
+            // Process the document as the non-batched mode would
+            std::string output;
+            int         status = 0;
+            try {
+                styml::Document doc = styml::parse(docText);
+                output              = doDumpAsYaml ? doc.asYaml() : doc.asPyStruct(true);
+                while (!output.empty() && output.back() == '\0') { output.pop_back(); }
+                output.push_back('\n');
+            } catch (styml::ParseException& e) {
+                output = std::string(e.what()) + "\n";
+                status = 1;
+            }
+            printf("%zu %d\n", output.size(), status);
+            fwrite(output.data(), 1, output.size(), stdout);
+            fflush(stdout);
+        }
+        return 0;
+    }
+
+    // Batch mode: process a stream of framed documents in one single process, to amortize the process launch cost.
+    // Each frame is "---STYML-BATCH <payload byte quantity>[ <status>]\n" followed by the payload bytes, the status
+    // being present only in the emitted stream (0 if parsing succeeded, 1 else with the error message as payload).
+    // =============================================================================================================
+    if (doBatch) {
+        std::string       stream((std::istreambuf_iterator<char>(std::cin)), std::istreambuf_iterator<char>());
+        const std::string marker = "---STYML-BATCH ";
+        size_t            offset = 0;
+        while (offset < stream.size()) {
+            // Decode the frame header
+            size_t eol = stream.find('\n', offset);
+            if (eol == std::string::npos || stream.compare(offset, marker.size(), marker) != 0) {
+                fprintf(stderr, "Error: corrupted batch frame header\n");
+                return 1;
+            }
+            size_t docSize = (size_t)std::stoull(stream.substr(offset + marker.size(), eol - offset - marker.size()));
+            if (eol + 1 + docSize > stream.size()) {
+                fprintf(stderr, "Error: truncated batch document\n");
+                return 1;
+            }
+            std::string docText = stream.substr(eol + 1, docSize);
+            if (docText.empty() || docText.back() != '\n') { docText.push_back('\n'); }
+            offset = eol + 1 + docSize;
+
+            // Process the document as the non-batched mode would
+            std::string output;
+            int         status = 0;
+            try {
+                styml::Document doc = styml::parse(docText);
+                output              = doDumpAsYaml ? doc.asYaml() : doc.asPyStruct(true);
+                // Match the printf-based output of the non-batched mode, which stops at the null terminator
+                while (!output.empty() && output.back() == '\0') { output.pop_back(); }
+                output.push_back('\n');
+            } catch (styml::ParseException& e) {
+                output = std::string(e.what()) + "\n";
+                status = 1;
+            }
+            printf("%s%zu %d\n", marker.c_str(), output.size(), status);
+            fwrite(output.data(), 1, output.size(), stdout);
+        }
+        fflush(stdout);
+        return 0;
+    }
+
     // Load / get the input text
     // =========================
     std::string inputText;
@@ -29,44 +29,61 @@ import sys
 import subprocess
 
 
-def shell(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
-    return subprocess.run(command, stdout=stdout, stderr=stderr, shell=True, universal_newlines=True, check=check)
+def run(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
+    # The command is a list of arguments, executed directly without any intermediate shell
+    try:
+        return subprocess.run(command, stdout=stdout, stderr=stderr, universal_newlines=True, check=check)
+    except FileNotFoundError:
+        # Report a missing binary (typically not yet built) as the shell would, instead of a traceback
+        return subprocess.CompletedProcess(command, 127, "", "%s: command not found" % command[0])
+
+
+def getSourceDir():
+    # The repository root is cached in the environment, so that child scripts do not fork git again
+    sourceDir = os.environ.get("STYML_SOURCE_DIR")
+    if not sourceDir:
+        sourceDir = subprocess.run(["git", "rev-parse", "--show-toplevel"], stdout=subprocess.PIPE,
+                                   universal_newlines=True, check=True).stdout.split('\n')[0]
+        os.environ["STYML_SOURCE_DIR"] = sourceDir
+    return sourceDir
 
 
 def main():
     # Get the defaults depending on the OS
-    if sys.platform == "win32":
-        defaultBuildType = "Release"
-        defaultPythonCall = "python "
-    else:
-        defaultBuildType = ""
-        defaultPythonCall = ""
+    defaultBuildType = "Release" if sys.platform == "win32" else ""
 
-    # Get all the input for the task
-    if [1 for arg in sys.argv if [1 for h in ["-h", "-help", "--help"] if h in arg]]:
-        print("Syntax: %s [options]" % sys.argv[0])
-        print("  The expected location of the binaries is <git root>/<build folder>/bin/<type folder>/")
-        print("  Options:")
-        print("   -h / --help            This help message")
-        print("   -b=<sub-build folder>  Name of the build folder. Default is ''")
-        print("   -t=<type folder>       Name of the build type folder. Default is 'Release' on Windows, '' on Linux")
-        print("   -ut                    Only the unit tests. Default is both unit tests and pattern-based test suite")
-        print("   -ts                    Only the test suite. Default is both unit tests and pattern-based test suite")
-        sys.exit(1)
-    subBuildFolder = ([arg[3:] for arg in sys.argv if arg[:3] == "-b="] + [""])[0]
-    buildType = ([arg[3:] for arg in sys.argv if arg[:3] == "-t="] + [defaultBuildType])[0]
-    doUnitTests = not not [1 for arg in sys.argv if arg == "-ut"]
-    doTestSuite = not not [1 for arg in sys.argv if arg == "-ts"]
+    # Get all the input for the task, in a single pass over the arguments
+    subBuildFolder, buildType = "", defaultBuildType
+    doUnitTests, doTestSuite = False, False
+    for arg in sys.argv[1:]:
+        if arg in ("-h", "-help", "--help"):
+            print("Syntax: %s [options]" % sys.argv[0])
+            print("  The expected location of the binaries is <git root>/<build folder>/bin/<type folder>/")
+            print("  Options:")
+            print("   -h / --help            This help message")
+            print("   -b=<sub-build folder>  Name of the build folder. Default is ''")
+            print("   -t=<type folder>       Name of the build type folder. Default is 'Release' on Windows, '' on Linux")
+            print("   -ut                    Only the unit tests. Default is both unit tests and pattern-based test suite")
+            print("   -ts                    Only the test suite. Default is both unit tests and pattern-based test suite")
+            sys.exit(1)
+        elif arg[:3] == "-b=":
+            subBuildFolder = arg[3:]
+        elif arg[:3] == "-t=":
+            buildType = arg[3:]
+        elif arg == "-ut":
+            doUnitTests = True
+        elif arg == "-ts":
+            doTestSuite = True
     if not doUnitTests and not doTestSuite:
         doUnitTests, doTestSuite = True, True
-    sourceDir = shell("git rev-parse --show-toplevel", check=True).stdout.split('\n')[0]
+    sourceDir = getSourceDir()
     testBinPath = os.path.join(sourceDir, "test", "")
     buildBinPath = os.path.join(sourceDir, "build", subBuildFolder, "bin", buildType, "")
     os.chdir(sourceDir)
 
     # Execute the unit tests
     if doUnitTests:
-        ret = shell('%sstyml_unittest sanity benchmark' % buildBinPath, stdout=None)
+        ret = run(["%sstyml_unittest" % buildBinPath, "sanity", "benchmark"], stdout=None)
         if ret.stderr:
             print("*** Error while executing the unit tests:\n%s" % ret.stderr)
         if ret.returncode != 0:
@@ -74,8 +91,8 @@ def main():
 
     # Execute the test suite
     if doTestSuite:
-        ret = shell('%s%stestsuite.py "%sstyml_encoder -" ./test/patterns -v' %
-                    (defaultPythonCall, testBinPath, buildBinPath), stdout=None)
+        ret = run([sys.executable, "%stestsuite.py" % testBinPath,
+                   "%sstyml_encoder -" % buildBinPath, "./test/patterns", "-v"], stdout=None)
         if ret.stderr:
             print("*** Error while executing the test suite:\n%s" % ret.stderr)
         if ret.returncode != 0:
@@ -29,8 +29,23 @@ import sys
 import subprocess
 
 
-def shell(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
-    return subprocess.run(command, stdout=stdout, stderr=stderr, shell=True, universal_newlines=True, check=check)
+def run(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
+    # The command is a list of arguments, executed directly without any intermediate shell
+    try:
+        return subprocess.run(command, stdout=stdout, stderr=stderr, universal_newlines=True, check=check)
+    except FileNotFoundError:
+        # Report a missing binary (typically not yet built) as the shell would, instead of a traceback
+        return subprocess.CompletedProcess(command, 127, "", "%s: command not found" % command[0])
+
+
+def getSourceDir():
+    # The repository root is cached in the environment, so that child scripts do not fork git again
+    sourceDir = os.environ.get("STYML_SOURCE_DIR")
+    if not sourceDir:
+        sourceDir = subprocess.run(["git", "rev-parse", "--show-toplevel"], stdout=subprocess.PIPE,
+                                   universal_newlines=True, check=True).stdout.split('\n')[0]
+        os.environ["STYML_SOURCE_DIR"] = sourceDir
+    return sourceDir
 
 
 def main():
@@ -40,14 +55,14 @@ def main():
         sys.exit(1)
     doFix = not not [1 for arg in sys.argv if arg == "fix"]
 
-    sourceDir = shell("git rev-parse --show-toplevel", check=True).stdout.split('\n')[0]
+    sourceDir = getSourceDir()
     os.chdir(sourceDir)
 
-    for cmd in ["check.py", "format.py%s" % ("" if doFix else " nofix"), "tidy.py%s" % (" fix" if doFix else "")]:
-        print("--- Launching %s" % cmd)
-        ret = shell('./ci/%s' % cmd, stdout=None)
+    for cmd in [["check.py"], ["format.py"] + ([] if doFix else ["nofix"]), ["tidy.py"] + (["fix"] if doFix else [])]:
+        print("--- Launching %s" % " ".join(cmd))
+        ret = run([sys.executable, "./ci/%s" % cmd[0]] + cmd[1:], stdout=None)
         if ret.returncode != 0:
-            print("ERROR: %s failed" % cmd)
+            print("ERROR: %s failed" % " ".join(cmd))
             if ret.stderr:
                 print(ret.stderr)
             sys.exit(ret.returncode)
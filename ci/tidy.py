@@ -34,6 +34,16 @@ def shell(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
         command, stdout=stdout, stderr=stderr, shell=True, universal_newlines=True, check=check)
 
 
+def getSourceDir():
+    # The repository root is cached in the environment, so that child scripts do not fork git again
+    sourceDir = os.environ.get("STYML_SOURCE_DIR")
+    if not sourceDir:
+        sourceDir = subprocess.run(["git", "rev-parse", "--show-toplevel"], stdout=subprocess.PIPE,
+                                   universal_newlines=True, check=True).stdout.split('\n')[0]
+        os.environ["STYML_SOURCE_DIR"] = sourceDir
+    return sourceDir
+
+
 def main():
     # Get all the input for the task
     if [1 for arg in sys.argv if [1 for h in ["-h", "-help", "--help"] if h in arg]]:
@@ -41,7 +51,7 @@ def main():
         sys.exit(1)
     doFix = not not [1 for arg in sys.argv if arg == "fix"]
 
-    sourceDir = shell("git rev-parse --show-toplevel", check=True).stdout.split('\n')[0]
+    sourceDir = getSourceDir()
     buildDir = os.path.join(sourceDir, "build", "tidy")
     os.makedirs(buildDir, exist_ok=True)
     os.chdir(buildDir)